@@ -8,14 +8,14 @@ updates via Server-Sent Events (SSE) for real-time UI animations.
 
 from flask import Flask, render_template, request, Response, jsonify
 from research_agent import ResearchAgent
-from db_utils import init_db, save_report, get_history
+from db_utils import init_db, save_report, get_history, get_recent_report
 from dotenv import load_dotenv
 import os
 import logging
-from contextlib import contextmanager
-import json
-import sqlite3
-from datetime import datetime
+import orjson
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging for better debugging
 logging.basicConfig(level=logging.INFO)
@@ -24,37 +24,101 @@ logger = logging.getLogger(__name__)
 # Initialize Flask app
 app = Flask(__name__)
 
-# Load environment variables from .env file
+# Load environment variables from .env file once and fail fast if keys are missing
 load_dotenv()
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+TAVILY_API_KEY = os.getenv('TAVILY_API_KEY')
+if not GEMINI_API_KEY or not TAVILY_API_KEY:
+    raise ValueError("GEMINI_API_KEY or TAVILY_API_KEY missing in .env file")
 
 # Initialize research agent (lazy-loaded with API keys)
 agent = None
+_agent_lock = threading.Lock()
 
 def get_agent():
     """Initialize or retrieve the ResearchAgent singleton.
 
+    Construction is guarded by a lock so concurrent first requests build
+    only one agent.
+
     Returns:
         ResearchAgent: The initialized agent with API keys from .env.
-    Raises:
-        ValueError: If API keys are missing in .env file.
     """
     global agent
     if agent is None:
-        gemini_key = os.getenv('GEMINI_API_KEY')
-        tavily_key = os.getenv('TAVILY_API_KEY')
-        if not gemini_key or not tavily_key:
-            raise ValueError("GEMINI_API_KEY or TAVILY_API_KEY missing in .env file")
-        agent = ResearchAgent(gemini_key, tavily_key)
+        with _agent_lock:
+            if agent is None:
+                agent = ResearchAgent(GEMINI_API_KEY, TAVILY_API_KEY)
     return agent
 
-@contextmanager
-def get_db_connection():
-    """Context manager for database connections."""
-    conn = sqlite3.connect('research.db')
+# Research jobs run on a background pool, decoupled from the request thread
+_research_pool = ThreadPoolExecutor(max_workers=8)
+_STREAM_END = object()
+# Idle seconds before sending an SSE comment to keep proxies from closing the stream
+_KEEPALIVE_SECONDS = 15
+# Stop nginx from buffering the stream and browsers from caching it
+_SSE_HEADERS = {'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'}
+
+def run_research(query: str, events: queue.Queue) -> None:
+    """Run a research job and publish its events to a queue.
+
+    The report is saved here rather than in the request handler, so it is
+    stored even if the client disconnects before the job finishes.
+
+    Args:
+        query (str): The user query.
+        events (queue.Queue): Queue receiving progress, report, and error events.
+    """
     try:
-        yield conn
+        cached = get_recent_report(query)
+        if cached:
+            logger.info(f"Serving cached report for query: {query}")
+            events.put({'type': 'report', 'report': cached})
+            return
+        for progress in get_agent().generate_report_stream(query):
+            events.put(progress)
+            if progress['type'] == 'report':
+                # The client already has the report; a failed save must not turn it into an error
+                try:
+                    save_report(query, progress['report'])
+                    logger.info(f"Generated and saved report for query: {query}")
+                except Exception as e:
+                    logger.error(f"Failed to save report for query '{query}': {str(e)}")
+    except Exception as e:
+        logger.error(f"Error researching query '{query}': {str(e)}")
+        events.put({'type': 'error', 'message': str(e)})
     finally:
-        conn.close()
+        events.put(_STREAM_END)
+
+def stream_research(query: str):
+    """Submit a research job and stream its events as SSE messages.
+
+    Args:
+        query (str): The user query.
+
+    Yields:
+        bytes: SSE-formatted event lines.
+    """
+    events = queue.Queue()
+    _research_pool.submit(run_research, query, events)
+    while True:
+        try:
+            event = events.get(timeout=_KEEPALIVE_SECONDS)
+        except queue.Empty:
+            yield b":\n\n"
+            continue
+        # Send everything already queued (e.g. parallel extractions finishing together) in one write
+        frames = []
+        while event is not _STREAM_END:
+            frames.append(b"data: " + orjson.dumps(event) + b"\n\n")
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                break
+        if frames:
+            yield b"".join(frames)
+        if event is _STREAM_END:
+            break
 
 @app.route('/')
 def index():
@@ -82,30 +146,7 @@ def research():
         logger.warning("Received empty query in /research endpoint")
         return jsonify({'error': 'Missing query'}), 400
 
-    def generate_events():
-        try:
-            agent = get_agent()
-            report = None
-            for progress in agent.generate_report_stream(query):
-                if progress['type'] == 'progress':
-                    yield f"data: {json.dumps(progress)}\n\n"
-                elif progress['type'] == 'report':
-                    report = progress['report']
-                    yield f"data: {json.dumps(progress)}\n\n"
-            
-            if report:
-                with get_db_connection() as conn:
-                    c = conn.cursor()
-                    c.execute("INSERT INTO reports (query, report, timestamp) VALUES (?, ?, ?)",
-                              (query, report, datetime.now().isoformat()))
-                    conn.commit()
-                logger.info(f"Generated and saved report for query: {query}")
-        except Exception as e:
-            error_msg = {'type': 'error', 'message': str(e)}
-            logger.error(f"Error in /research endpoint: {str(e)}")
-            yield f"data: {json.dumps(error_msg)}\n\n"
-
-    return Response(generate_events(), mimetype='text/event-stream')
+    return Response(stream_research(query), mimetype='text/event-stream', headers=_SSE_HEADERS)
 
 @app.route('/research-stream', methods=['GET'])
 def research_stream():
@@ -123,40 +164,23 @@ def research_stream():
         logger.warning("Received empty query in /research-stream endpoint")
         return jsonify({'error': 'Missing query'}), 400
 
-    def generate_events():
-        try:
-            agent = get_agent()
-            report = None
-            for progress in agent.generate_report_stream(query):
-                if progress['type'] == 'progress':
-                    yield f"data: {json.dumps(progress)}\n\n"
-                elif progress['type'] == 'report':
-                    report = progress['report']
-                    yield f"data: {json.dumps(progress)}\n\n"
-            
-            if report:
-                with get_db_connection() as conn:
-                    c = conn.cursor()
-                    c.execute("INSERT INTO reports (query, report, timestamp) VALUES (?, ?, ?)",
-                              (query, report, datetime.now().isoformat()))
-                    conn.commit()
-                logger.info(f"Generated and saved report for query: {query}")
-        except Exception as e:
-            error_msg = {'type': 'error', 'message': str(e)}
-            logger.error(f"Error in /research-stream endpoint: {str(e)}")
-            yield f"data: {json.dumps(error_msg)}\n\n"
-
-    return Response(generate_events(), mimetype='text/event-stream')
+    return Response(stream_research(query), mimetype='text/event-stream', headers=_SSE_HEADERS)
 
 @app.route('/history', methods=['GET'])
 def history():
     """Retrieve and return the search history.
 
+    Accepts optional 'limit' (default 50, at most 200) and 'offset' (default 0)
+    URL parameters for paging through older reports.
+
     Returns:
         JSON response: List of past queries and reports or error message.
     """
+    # Clamp paging values: SQLite treats a negative LIMIT as unbounded
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    offset = max(0, request.args.get('offset', 0, type=int))
     try:
-        history_list = get_history()
+        history_list = get_history(limit=limit, offset=offset)
         logger.info("Retrieved search history")
         return jsonify({'history': history_list})
     except Exception as e:
@@ -1,30 +1,87 @@
 """Database utilities for managing research reports in SQLite.
 
 This module provides functions to initialize the database, save reports,
-and retrieve search history.
+and retrieve search history. Connections are long-lived and shared through
+a small thread-safe pool so SQLite's page cache stays warm between requests.
+Report bodies are stored zstd-compressed; rows written as plain text by older
+versions are still read transparently.
 """
 
 import sqlite3
-from datetime import datetime
+import queue
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import logging
+from typing import Iterator
+import zstandard as zstd
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+DB_PATH = 'research.db'
+POOL_SIZE = 8
+
+_POOL: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=POOL_SIZE)
+
+def encode_report(report: str) -> bytes:
+    """Compress report text for storage (shared by the Flask and Streamlit apps)."""
+    return zstd.compress(report.encode('utf-8'), 3)
+
+def decode_report(value: bytes | str) -> str:
+    """Return report text, decompressing it unless it predates compression."""
+    if isinstance(value, bytes):
+        return zstd.decompress(value).decode('utf-8')
+    return value
+
+def _connect() -> sqlite3.Connection:
+    """Open a new connection configured for concurrent, low-latency access."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+@contextmanager
+def get_conn() -> Iterator[sqlite3.Connection]:
+    """Borrow a connection from the pool, returning it when done.
+
+    A new connection is opened if the pool is empty; surplus connections are
+    closed instead of being returned to a full pool.
+
+    Yields:
+        sqlite3.Connection: A pooled database connection.
+    """
+    try:
+        conn = _POOL.get_nowait()
+    except queue.Empty:
+        conn = _connect()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            _POOL.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
 def init_db() -> None:
-    """Initialize the SQLite database and create the reports table if it doesn't exist."""
+    """Initialize the SQLite database, create the reports table, and fill the connection pool."""
     try:
-        conn = sqlite3.connect('research.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS reports
-                     (id INTEGER PRIMARY KEY, query TEXT, report TEXT, timestamp TEXT)''')
-        conn.commit()
+        with get_conn() as conn:
+            c = conn.cursor()
+            c.execute('''CREATE TABLE IF NOT EXISTS reports
+                         (id INTEGER PRIMARY KEY, query TEXT, report TEXT, timestamp TEXT)''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_reports_ts ON reports(timestamp DESC)")
+            conn.commit()
+        while not _POOL.full():
+            _POOL.put_nowait(_connect())
         logger.info("Database initialized")
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
         raise
-    finally:
-        conn.close()
 
 def save_report(query: str, report: str) -> None:
     """Save a research report to the database.
@@ -33,34 +90,68 @@ def save_report(query: str, report: str) -> None:
         query (str): The user query.
         report (str): The generated report text.
     """
+    save_reports([(query, report)])
+
+def save_reports(rows: list[tuple[str, str]]) -> None:
+    """Save several research reports in a single transaction.
+
+    Args:
+        rows (list[tuple[str, str]]): (query, report) pairs to insert.
+    """
+    if not rows:
+        return
+    now = datetime.now().isoformat()
     try:
-        conn = sqlite3.connect('research.db')
-        c = conn.cursor()
-        c.execute("INSERT INTO reports (query, report, timestamp) VALUES (?, ?, ?)",
-                  (query, report, datetime.now().isoformat()))
-        conn.commit()
-        logger.debug(f"Saved report for query: {query}")
+        with get_conn() as conn:
+            with conn:
+                conn.executemany("INSERT INTO reports (query, report, timestamp) VALUES (?, ?, ?)",
+                                 [(query, encode_report(report), now) for query, report in rows])
+        logger.debug(f"Saved {len(rows)} report(s)")
     except Exception as e:
-        logger.error(f"Error saving report: {str(e)}")
+        logger.error(f"Error saving reports: {str(e)}")
         raise
-    finally:
-        conn.close()
 
-def get_history() -> list[dict]:
-    """Retrieve all past reports from the database.
+def get_recent_report(query: str, max_age: timedelta = timedelta(days=1)) -> str | None:
+    """Return the newest stored report for an identical query, if it is recent enough.
+
+    Args:
+        query (str): The user query.
+        max_age (timedelta): Oldest report age to reuse (default: 1 day).
+
+    Returns:
+        str | None: The cached report text, or None if there is no recent match.
+    """
+    cutoff = (datetime.now() - max_age).isoformat()
+    try:
+        with get_conn() as conn:
+            c = conn.cursor()
+            c.execute("SELECT report FROM reports WHERE query = ? AND timestamp > ? ORDER BY timestamp DESC LIMIT 1",
+                      (query, cutoff))
+            row = c.fetchone()
+        return decode_report(row[0]) if row else None
+    except Exception as e:
+        logger.error(f"Error looking up cached report: {str(e)}")
+        raise
+
+def get_history(limit: int = 50, offset: int = 0) -> list[dict]:
+    """Retrieve the most recent past reports from the database.
+
+    Args:
+        limit (int): Maximum number of reports to return (default: 50).
+        offset (int): Number of most recent reports to skip (default: 0).
 
     Returns:
         list[dict]: List of dictionaries containing query, report, and timestamp.
     """
     try:
-        conn = sqlite3.connect('research.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM reports ORDER BY timestamp DESC")
-        rows = c.fetchall()
+        with get_conn() as conn:
+            c = conn.cursor()
+            c.row_factory = sqlite3.Row
+            c.execute("SELECT query, report, timestamp FROM reports ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+                      (limit, offset))
+            rows = c.fetchall()
         logger.debug("Retrieved search history")
-        return [{'query': row[1], 'report': row[2], 'timestamp': row[3]} for row in rows]
+        return [{**dict(row), 'report': decode_report(row['report'])} for row in rows]
     except Exception as e:
         logger.error(f"Error retrieving history: {str(e)}")
         raise
-    finally:
-        conn.close()
\ No newline at end of file
@@ -10,9 +10,17 @@ import google.generativeai as genai
 from tavily import TavilyClient
 import trafilatura
 from readability.readability import Document
+from selectolax.parser import HTMLParser
 import requests
+from requests.adapters import HTTPAdapter
 from pypdf import PdfReader
-from io import BytesIO
+import tempfile
+import re
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from itertools import islice
+import threading
+from cachetools import TTLCache
 import logging
 import json
 from typing import Dict, Any, Generator, List
@@ -20,6 +28,34 @@ from typing import Dict, Any, Generator, List
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Limit text to avoid exceeding Gemini free-tier token limits
+MAX_TEXT_CHARS = 50000
+# Sources shorter than this skip the relevance-extraction call and go straight to summarization
+SHORT_TEXT_CHARS = 4000
+# Original URL plus replacements tried before a source is given up on
+MAX_SOURCE_ATTEMPTS = 3
+# PDFs larger than this are skipped rather than downloaded and parsed
+MAX_PDF_BYTES = 20_000_000
+
+# Domains that are paywalled or render content with JavaScript, so extraction rarely yields text
+_BLOCKLIST_RE = re.compile(
+    r'(?:^|\.)(?:youtube\.com|youtu\.be|facebook\.com|instagram\.com|tiktok\.com|twitter\.com|x\.com'
+    r'|linkedin\.com|pinterest\.com|wsj\.com|ft\.com)$',
+    re.I,
+)
+_SUPPORTED_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'application/pdf')
+# Fall back to readability when both trafilatura and selectolax find no text
+READABILITY_FALLBACK = True
+# Matches PDF URLs in any case, including ones with a query string or fragment
+_PDF_RE = re.compile(r'\.pdf(?:$|[?#])', re.I)
+
+# Prompt templates, formatted with the user's query
+EXTRACT_PROMPT = "Extract only the most relevant information to the query '{query}' from this text. Be concise and include key points only, nothing extra or irrelevant:\n\n"
+SUMMARY_PROMPT = "Summarize this relevant content for the query '{query}' in a few key points:\n\n"
+REPORT_PROMPT = "Tailor a short, structured report to directly answer the user's query: '{query}'. Focus on the most relevant key findings from these source summaries. Use bullet points for insights, explanations, and recommendations specific to this question. Include source links at the end. Format in Markdown for better readability:"
+NO_SOURCES_PROMPT = "Tailor a short, structured report to directly answer the user's query: '{query}'. Use bullet points for key findings. Note limited information. Format in Markdown:"
+NO_EXTRACTS_PROMPT = "Tailor a short, structured report to directly answer the user's query: '{query}'. Use bullet points for key findings and note that no sources were successfully extracted. Format in Markdown:"
+
 class ResearchAgent:
     def __init__(self, gemini_api_key: str, tavily_api_key: str):
         """Initialize the ResearchAgent with API keys.
@@ -32,12 +68,32 @@ class ResearchAgent:
         self.model = genai.GenerativeModel('gemini-1.5-flash')
         self.tavily = TavilyClient(api_key=tavily_api_key)
         self.target_sources = 3  # Target number of viable sources
+        # One keep-alive session for all fetches so repeat hosts reuse TCP/TLS connections
+        self.http = requests.Session()
+        self.http.headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+        self._llm_slots = threading.Semaphore(4)  # Bound concurrent Gemini calls (rate limits)
+        # Memoize remote calls for repeat queries/URLs; the lock guards access from worker threads
+        self._search_cache = TTLCache(maxsize=256, ttl=600)
+        self._extract_cache = TTLCache(maxsize=1024, ttl=3600)
+        self._cache_lock = threading.Lock()
         logger.info("ResearchAgent initialized")
 
+    def close(self) -> None:
+        """Close the pooled HTTP connections."""
+        self.http.close()
+
     def _yield_progress(self, message: str, details: Dict[str, Any] = None) -> Generator[Dict[str, Any], None, None]:
         """Yield a progress event."""
         yield {'type': 'progress', 'message': message, 'details': details or {}}
 
+    def _generate(self, prompt: str):
+        """Call the Gemini model, limiting how many requests run concurrently."""
+        with self._llm_slots:
+            return self.model.generate_content(prompt)
+
     def _find_replacement_url(self, original_query: str, failed_url: str) -> str | None:
         """Search for a replacement URL if the original fails.
 
@@ -61,9 +117,86 @@ class ResearchAgent:
         return None
 
     def extract_relevant_content(self, url: str, query: str, original_query: str = None) -> tuple[str | None, bool]:
-        """Extract relevant content from a URL using trafilatura or readability for HTML, or pypdf for PDFs.
+        """Extract relevant content from a URL, reusing a cached result for the same (url, query).
 
-        If extraction fails, attempts to find and use a replacement URL.
+        Args:
+            url (str): URL of the content to extract.
+            query (str): User query for relevance filtering.
+            original_query (str): Original user query for replacement search.
+
+        Returns:
+            tuple[str | None, bool]: (relevant_text, was_replaced) where was_replaced is True if a replacement was used.
+        """
+        key = (url, query)
+        with self._cache_lock:
+            cached = self._extract_cache.get(key)
+        if cached is not None:
+            logger.debug(f"Using cached extraction for {url}")
+            return cached
+        result = self._extract_uncached(url, query, original_query)
+        if result[0]:
+            with self._cache_lock:
+                self._extract_cache[key] = result
+        return result
+
+    def _fetch_text(self, url: str) -> str:
+        """Download a URL and extract its text using trafilatura or selectolax for HTML, or pypdf for PDFs.
+
+        Args:
+            url (str): URL of the content to fetch.
+
+        Returns:
+            str: The extracted text.
+        Raises:
+            requests.exceptions.HTTPError: If the server returns an error status.
+            ValueError: If no text could be extracted from HTML, or the PDF exceeds MAX_PDF_BYTES.
+        """
+        if _PDF_RE.search(url):
+            with self.http.get(url, timeout=10, stream=True) as resp:
+                resp.raise_for_status()
+                if int(resp.headers.get('Content-Length') or 0) > MAX_PDF_BYTES:
+                    raise ValueError(f"PDF larger than {MAX_PDF_BYTES // 1_000_000} MB")
+                # Spool the download to disk past 2 MB instead of holding it all in memory
+                with tempfile.SpooledTemporaryFile(max_size=2_000_000) as buf:
+                    for chunk in resp.iter_content(65536):
+                        buf.write(chunk)
+                        # Content-Length can be missing or wrong, so enforce the cap on the bytes read too
+                        if buf.tell() > MAX_PDF_BYTES:
+                            raise ValueError(f"PDF larger than {MAX_PDF_BYTES // 1_000_000} MB")
+                    buf.seek(0)
+                    pdf = PdfReader(buf)
+                    parts = []
+                    total = 0
+                    for page in pdf.pages:
+                        page_text = (page.extract_text() or '') + '\n'
+                        parts.append(page_text)
+                        total += len(page_text)
+                        if total >= MAX_TEXT_CHARS:
+                            break
+                    return ''.join(parts)
+
+        # Use requests instead of trafilatura.fetch_url to support headers
+        resp = self.http.get(url, timeout=10)
+        resp.raise_for_status()
+        text = trafilatura.extract(resp.text)
+        if not text:
+            # Fast C-based fallback: plain body text without scripts and page chrome
+            tree = HTMLParser(resp.text)
+            for node in tree.css('script, style, nav, footer'):
+                node.decompose()
+            if tree.body is not None:
+                text = tree.body.text(separator=' ', strip=True)
+        if not text and READABILITY_FALLBACK:
+            doc = Document(resp.text)
+            text = doc.summary()
+        if not text:
+            raise ValueError("No content extracted from HTML")
+        return text
+
+    def _extract_uncached(self, url: str, query: str, original_query: str = None) -> tuple[str | None, bool]:
+        """Extract relevant content from a URL, falling back to replacement URLs on failure.
+
+        Tries the URL and then up to MAX_SOURCE_ATTEMPTS - 1 replacements found via search.
 
         Args:
             url (str): URL of the content to extract.
@@ -73,58 +206,89 @@ class ResearchAgent:
         Returns:
             tuple[str | None, bool]: (relevant_text, was_replaced) where was_replaced is True if a replacement was used.
         """
+        current_url = url
         was_replaced = False
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        try:
-            if url.lower().endswith('.pdf'):
-                resp = requests.get(url, headers=headers, timeout=10)
-                resp.raise_for_status()
-                pdf = PdfReader(BytesIO(resp.content))
-                text = ''
-                for page in pdf.pages:
-                    text += page.extract_text() + '\n'
-            else:
-                # Use requests instead of trafilatura.fetch_url to support headers
-                resp = requests.get(url, headers=headers, timeout=10)
-                resp.raise_for_status()
-                text = trafilatura.extract(resp.text)
-                if not text:
-                    doc = Document(resp.text)
-                    text = doc.summary()
-                if not text:
-                    raise ValueError("No content extracted from HTML")
-
-            # Limit text to avoid exceeding Gemini free-tier token limits
-            if len(text) > 50000:
-                text = text[:50000]
-            extract_prompt = f"Extract only the most relevant information to the query '{query}' from this text. Be concise and include key points only, nothing extra or irrelevant:"
-            response = self.model.generate_content(extract_prompt + "\n\n" + text)
-            logger.debug(f"Extracted relevant content from {url}")
-            return response.text, was_replaced
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code in [403, 404]:
-                logger.warning(f"HTTP error {e.response.status_code} for {url}. Attempting replacement...")
-                replacement = self._find_replacement_url(original_query or query, url)
-                if replacement:
-                    logger.info(f"Using replacement URL for {url}: {replacement}")
-                    return self.extract_relevant_content(replacement, query, original_query), True
-                else:
-                    logger.warning(f"No replacement found for {url}")
+        for attempt in range(MAX_SOURCE_ATTEMPTS):
+            try:
+                text = self._fetch_text(current_url)
+                if len(text) < SHORT_TEXT_CHARS:
+                    logger.debug(f"Using short content from {current_url} as-is")
+                    return text, was_replaced
+                if len(text) > MAX_TEXT_CHARS:
+                    text = text[:MAX_TEXT_CHARS]
+                response = self._generate(EXTRACT_PROMPT.format(query=query) + text)
+                logger.debug(f"Extracted relevant content from {current_url}")
+                return response.text, was_replaced
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code not in [403, 404]:
+                    logger.warning(f"HTTP error extracting content from {current_url}: {str(e)}")
                     return None, False
-            else:
-                logger.warning(f"HTTP error extracting content from {url}: {str(e)}")
-                return None, False
-        except Exception as e:
-            logger.warning(f"Error extracting content from {url}: {str(e)}")
-            replacement = self._find_replacement_url(original_query or query, url)
-            if replacement:
-                logger.info(f"Using replacement URL for {url}: {replacement}")
-                return self.extract_relevant_content(replacement, query, original_query), True
-            else:
-                logger.warning(f"No replacement found for {url}")
+                logger.warning(f"HTTP error {e.response.status_code} for {current_url}. Attempting replacement...")
+            except Exception as e:
+                logger.warning(f"Error extracting content from {current_url}: {str(e)}")
+
+            if attempt == MAX_SOURCE_ATTEMPTS - 1:
+                break
+            replacement = self._find_replacement_url(original_query or query, current_url)
+            if not replacement:
+                logger.warning(f"No replacement found for {current_url}")
                 return None, False
+            logger.info(f"Using replacement URL for {current_url}: {replacement}")
+            current_url = replacement
+            was_replaced = True
+
+        logger.warning(f"Giving up on {url} after {MAX_SOURCE_ATTEMPTS} attempts")
+        return None, False
+
+    def _head_ok(self, url: str) -> bool:
+        """Cheaply check with a HEAD request whether a URL is worth extracting.
+
+        Only definite failures (missing pages or unsupported content types) reject the URL;
+        servers that refuse or mishandle HEAD are given the benefit of the doubt.
+        """
+        try:
+            resp = self.http.head(url, timeout=3, allow_redirects=True)
+        except requests.exceptions.RequestException:
+            return True
+        if resp.status_code in (404, 410):
+            return False
+        if _PDF_RE.search(url):
+            return True  # PDFs are routed by URL, and CDNs often serve them as octet-stream
+        content_type = resp.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if resp.ok and content_type and content_type not in _SUPPORTED_CONTENT_TYPES:
+            return False
+        return True
+
+    def _extract_candidate(self, url: str, query: str) -> tuple[str | None, bool]:
+        """Extract a search candidate, skipping it if a HEAD check shows it can't yield content.
+
+        Runs in the extraction workers, so the HEAD round trip overlaps other sources' fetches.
+        """
+        if not self._head_ok(url):
+            logger.debug(f"HEAD check skipped {url}")
+            return None, False
+        return self.extract_relevant_content(url, query, query)
+
+    def _prefilter(self, urls: List[str]) -> List[str]:
+        """Drop duplicate-domain and blocklisted URLs before paying for extraction.
+
+        Args:
+            urls (list[str]): Candidate URLs in ranking order.
+
+        Returns:
+            list[str]: The URLs worth extracting, in their original order.
+        """
+        seen_domains = set()
+        candidates = []
+        for url in urls:
+            domain = (urlparse(url).hostname or '').lower().removeprefix('www.')
+            if not domain or domain in seen_domains or _BLOCKLIST_RE.search(domain):
+                logger.debug(f"Pre-filter skipped {url}")
+                continue
+            seen_domains.add(domain)
+            candidates.append(url)
+        logger.debug(f"Pre-filter kept {len(candidates)}/{len(urls)} sources")
+        return candidates
 
     def search_sources(self, query: str, max_results: int = 5) -> List[str]:
         """Search for relevant sources using Tavily API.
@@ -136,10 +300,19 @@ class ResearchAgent:
         Returns:
             list[str]: List of URLs from search results.
         """
+        key = (query, max_results)
+        with self._cache_lock:
+            cached = self._search_cache.get(key)
+        if cached is not None:
+            logger.debug(f"Using cached search results for query: {query}")
+            return list(cached)
         try:
             search_response = self.tavily.search(query=query, max_results=max_results)
             urls = [result['url'] for result in search_response['results']]
             logger.debug(f"Found {len(urls)} sources for query: {query}")
+            if urls:
+                with self._cache_lock:
+                    self._search_cache[key] = tuple(urls)
             return urls
         except Exception as e:
             logger.error(f"Search failed for query '{query}': {str(e)}")
@@ -156,8 +329,7 @@ class ResearchAgent:
             str | None: Summary text or None if summarization fails.
         """
         try:
-            summary_prompt = f"Summarize this relevant content for the query '{query}' in a few key points:"
-            response = self.model.generate_content(summary_prompt + "\n\n" + content)
+            response = self._generate(SUMMARY_PROMPT.format(query=query) + content)
             logger.debug("Generated summary")
             return response.text
         except Exception as e:
@@ -178,63 +350,68 @@ class ResearchAgent:
         """
         yield from self._yield_progress("🔍 Searching for relevant sources...")
         
-        candidate_urls = self.search_sources(query, max_results=5)
+        candidate_urls = self._prefilter(self.search_sources(query, max_results=5))
         if not candidate_urls:
             yield from self._yield_progress("⚠️ No sources found. Generating report with limited data...")
-            overall_prompt = f"Tailor a short, structured report to directly answer the user's query: '{query}'. Use bullet points for key findings. Note limited information. Format in Markdown:"
-            response = self.model.generate_content(overall_prompt)
+            response = self._generate(NO_SOURCES_PROMPT.format(query=query))
             yield {'type': 'report', 'report': response.text}
             return
 
         yield from self._yield_progress("✅ Sources found. Now extracting content...", {'urls': candidate_urls[:3]})
 
         extracts = []
-        processed_count = 0
-        for url in candidate_urls:
-            if len(extracts) >= self.target_sources:
-                break
-            yield from self._yield_progress(f"📄 Extracting from source {len(extracts) + 1}: {url}")
-            content, replaced = self.extract_relevant_content(url, query, query)
-            if content:
-                extracts.append({'url': url if not replaced else f"Replacement for original: {url}", 'content': content})
-                yield from self._yield_progress(f"✅ Extracted from {url}" + (" (replacement used)" if replaced else ""))
-            processed_count += 1
-
-        # Try additional candidates if needed
-        while len(extracts) < self.target_sources and processed_count < len(candidate_urls):
-            remaining_url = candidate_urls[processed_count]
-            yield from self._yield_progress(f"📄 Trying additional source {len(extracts) + 1}/{self.target_sources}: {remaining_url}")
-            content, replaced = self.extract_relevant_content(remaining_url, query, query)
-            if content:
-                extracts.append({'url': remaining_url if not replaced else f"Replacement for original: {remaining_url}", 'content': content})
-                yield from self._yield_progress(f"✅ Extracted from {remaining_url}" + (" (replacement used)" if replaced else ""))
-            processed_count += 1
+        # Keep only as many extractions in flight as sources still needed; a failed source
+        # frees its slot for the next candidate, so no fetch or LLM call is wasted on extras
+        remaining = iter(candidate_urls)
+        with ThreadPoolExecutor(max_workers=self.target_sources) as executor:
+            pending = {}
+            for url in islice(remaining, self.target_sources):
+                pending[executor.submit(self._extract_candidate, url, query)] = url
+            yield from self._yield_progress(f"📄 Extracting from {len(pending)} sources in parallel...")
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    try:
+                        content, replaced = future.result()
+                    except Exception as e:
+                        logger.warning(f"Extraction worker failed for {url}: {str(e)}")
+                        content, replaced = None, False
+                    if content:
+                        extracts.append({'url': url if not replaced else f"Replacement for original: {url}", 'content': content})
+                        yield from self._yield_progress(f"✅ Extracted from {url}" + (" (replacement used)" if replaced else ""))
+                        continue
+                    next_url = next(remaining, None)
+                    if next_url is not None:
+                        yield from self._yield_progress(f"📄 Extracting from additional source: {next_url}")
+                        pending[executor.submit(self._extract_candidate, next_url, query)] = next_url
 
         if not extracts:
             yield from self._yield_progress("⚠️ No valid content extracted. Generating report with limited information...")
-            overall_prompt = f"Tailor a short, structured report to directly answer the user's query: '{query}'. Use bullet points for key findings and note that no sources were successfully extracted. Format in Markdown:"
-            response = self.model.generate_content(overall_prompt)
+            response = self._generate(NO_EXTRACTS_PROMPT.format(query=query))
             yield {'type': 'report', 'report': response.text}
             return
 
         yield from self._yield_progress("📝 Summarizing extracted content...")
 
         summaries = []
-        for ext in extracts:
-            yield from self._yield_progress(f"📝 Summarizing {ext['url']}...")
-            summary = self.summarize_content(ext['content'], query)
-            if summary:
-                summaries.append({'url': ext['url'], 'summary': summary})
-                yield from self._yield_progress(f"✅ Summarized {ext['url']}")
+        with ThreadPoolExecutor(max_workers=len(extracts)) as executor:
+            futures = {executor.submit(self.summarize_content, ext['content'], query): ext for ext in extracts}
+            for future in as_completed(futures):
+                ext = futures[future]
+                summary = future.result()
+                if summary:
+                    summaries.append({'url': ext['url'], 'summary': summary})
+                    yield from self._yield_progress(f"✅ Summarized {ext['url']}")
 
         yield from self._yield_progress("✨ Generating your personalized report...")
 
         # Tailored prompt to directly answer the user's query
-        overall_prompt = f"Tailor a short, structured report to directly answer the user's query: '{query}'. Focus on the most relevant key findings from these source summaries. Use bullet points for insights, explanations, and recommendations specific to this question. Include source links at the end. Format in Markdown for better readability:"
-        for sumry in summaries:
-            overall_prompt += f"\n\nSource: {sumry['url']}\nSummary: {sumry['summary']}"
+        parts = [REPORT_PROMPT.format(query=query)]
+        parts.extend(f"\n\nSource: {sumry['url']}\nSummary: {sumry['summary']}" for sumry in summaries)
+        overall_prompt = ''.join(parts)
 
-        response = self.model.generate_content(overall_prompt)
+        response = self._generate(overall_prompt)
         report = response.text
         logger.info(f"Generated tailored report for query: {query}")
         
@@ -1,23 +1,201 @@
 import streamlit as st
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import google.generativeai as genai
 from tavily import TavilyClient
 import trafilatura
 from readability.readability import Document  # Correct import for readability-lxml
 import requests
-from pypdf import PdfReader
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import pypdfium2 as pdfium
 from io import BytesIO
+import re
+import time
+import hashlib
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from sentence_transformers import SentenceTransformer
+# Same report storage format as the Flask app, which shares research.db
+from db_utils import encode_report, decode_report
 
-# Initialize database
-def init_db():
-    conn = sqlite3.connect('research.db')
+# Matches PDF URLs in any case, including ones with a query string or fragment
+PDF_RE = re.compile(r'\.pdf(?:$|[?#])', re.I)
+# Minimum cosine similarity for a stored query to count as the same question
+SIMILARITY_THRESHOLD = 0.92
+# Gemini tokens of each source passed into the single report prompt
+SOURCE_TOKEN_BUDGET = 4000
+# Characters gathered per source before token trimming; generous for token-sparse text
+SOURCE_CHAR_BUDGET = SOURCE_TOKEN_BUDGET * 6
+# Largest PDF download to parse; a truncated PDF can't be read, so bigger files are skipped
+MAX_PDF_BYTES = 20_000_000
+# HTML bytes read per page; plenty to yield a full source budget after extraction
+MAX_HTML_BYTES = 200_000
+# Seconds a source's extracted text is reused across queries before it is fetched again
+URL_CACHE_TTL = 24 * 3600
+# Oldest stored report the semantic cache will reuse (matches the Flask app's get_recent_report)
+REPORT_CACHE_MAX_AGE = timedelta(days=1)
+# PDFium is not thread-safe, so PDF parsing in the fetch workers must be serialized
+PDFIUM_LOCK = threading.Lock()
+
+# Open the database and create its schema once per process; Streamlit reruns reuse the connection
+@st.cache_resource
+def get_conn():
+    conn = sqlite3.connect('research.db', check_same_thread=False, isolation_level=None)
+    # WAL lets History reads run alongside inserts; NORMAL sync drops the per-commit fsync
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS reports
                  (id INTEGER PRIMARY KEY, query TEXT, report TEXT, timestamp TEXT)''')
-    conn.commit()
+    # Older databases predate the semantic cache column
+    columns = [row[1] for row in c.execute("PRAGMA table_info(reports)")]
+    if 'embedding' not in columns:
+        c.execute("ALTER TABLE reports ADD COLUMN embedding BLOB")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reports_ts ON reports(timestamp DESC)")
+    c.execute('''CREATE TABLE IF NOT EXISTS url_cache
+                 (url_hash TEXT PRIMARY KEY, url TEXT, text TEXT, fetched_at REAL)''')
     return conn
 
+# One keep-alive HTTP session per process so repeat hosts skip the TCP/TLS handshake
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=Retry(total=2, backoff_factor=0.3))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# Trim text to roughly `budget` Gemini tokens, measured with the model's own tokenizer
+def trim_to_tokens(model, text, budget=SOURCE_TOKEN_BUDGET):
+    try:
+        n = model.count_tokens(text).total_tokens
+    except Exception:
+        return text[:budget * 4]  # ~4 characters per token when counting isn't available
+    if n <= budget:
+        return text
+    return text[:int(len(text) * budget / n * 0.95)]
+
+# Fetch a source and extract its text.
+# Runs in worker threads, so it reports problems as a warning string instead of calling st.warning.
+def process_url(url, session, model):
+    try:
+        if PDF_RE.search(url):
+            # Handle PDF
+            with session.get(url, stream=True, timeout=10) as resp:
+                resp.raise_for_status()
+                buf = BytesIO()
+                for chunk in resp.iter_content(65536):
+                    buf.write(chunk)
+                    if buf.tell() > MAX_PDF_BYTES:
+                        return None, f"PDF at {url} is larger than {MAX_PDF_BYTES // 1_000_000} MB. Skipping."
+            buf.seek(0)
+            # PDFium (native) is far faster than pure-Python parsing; stop once the budget is filled
+            with PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(buf)
+                try:
+                    parts = []
+                    total = 0
+                    for page in pdf:
+                        page_text = page.get_textpage().get_text_range()
+                        parts.append(page_text)
+                        total += len(page_text)
+                        if total >= SOURCE_CHAR_BUDGET:
+                            break
+                    text = '\n'.join(parts)
+                finally:
+                    pdf.close()
+        else:
+            # Handle HTML: fetch once and feed the same page to both extractors
+            with session.get(url, stream=True, timeout=10) as resp:
+                resp.raise_for_status()
+                # Keep raw bytes: requests assumes ISO-8859-1 for text/* without a charset header,
+                # while both extractors detect the charset (including <meta> tags) from the bytes
+                html_buf = []
+                got = 0
+                for chunk in resp.iter_content(16384):
+                    html_buf.append(chunk)
+                    got += len(chunk)
+                    if got >= MAX_HTML_BYTES:
+                        break
+            html = b''.join(html_buf)
+            text = trafilatura.extract(html, url=url, favor_precision=True)
+            if not text:
+                # Fallback to readability-lxml
+                text = Document(html).summary()
+            if not text:
+                return None, f"Could not extract content from {url}. Skipping."
+
+        # Scanned PDFs and script-only pages can extract to nothing but whitespace
+        if not text.strip():
+            return None, f"No readable text found at {url}. Skipping."
+
+        # Limit each source so all of them fit in one report prompt
+        return {'url': url, 'text': trim_to_tokens(model, text[:SOURCE_CHAR_BUDGET])}, None
+    except requests.exceptions.RequestException as e:
+        return None, f"Error fetching {url} (possibly blocked): {str(e)}. Skipping."
+    except Exception as e:
+        return None, f"Unexpected error with {url}: {str(e)}. Skipping."
+
+def url_hash(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+# Return {url: text} for sources whose extracted text was cached within URL_CACHE_TTL
+def get_cached_texts(conn, urls):
+    cutoff = time.time() - URL_CACHE_TTL
+    cached = {}
+    for url in urls:
+        row = conn.execute("SELECT text FROM url_cache WHERE url_hash = ? AND fetched_at > ?",
+                           (url_hash(url), cutoff)).fetchone()
+        if row:
+            cached[url] = row[0]
+    return cached
+
+# Store freshly extracted {url: text} so later queries hitting the same sources skip the fetch
+def cache_texts(conn, texts):
+    now = time.time()
+    # The connection autocommits, so group the rows into one explicit transaction
+    conn.execute('BEGIN')
+    try:
+        conn.executemany("INSERT OR REPLACE INTO url_cache (url_hash, url, text, fetched_at) VALUES (?, ?, ?, ?)",
+                         [(url_hash(url), url, text, now) for url, text in texts.items()])
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+# Search results for a normalized query are reused for an hour; the client is excluded from the cache key
+@st.cache_data(ttl=3600, show_spinner=False)
+def tavily_search(_tavily, q_norm, k):
+    return _tavily.search(query=q_norm, max_results=k)['results']
+
+# Configure the API clients once per key pair instead of on every rerun
+@st.cache_resource
+def get_clients(gemini_key, tavily_key):
+    genai.configure(api_key=gemini_key)
+    model = genai.GenerativeModel('gemini-1.5-flash')  # Suitable for free tier
+    return model, TavilyClient(api_key=tavily_key)
+
+# Load the sentence embedding model once per process
+@st.cache_resource
+def get_embedder():
+    return SentenceTransformer('all-MiniLM-L6-v2')
+
+# Return a recent stored report whose query embedding is close enough to q_emb, if any
+def find_similar_report(conn, q_emb):
+    cutoff = (datetime.now() - REPORT_CACHE_MAX_AGE).isoformat()
+    rows = conn.execute("SELECT id, embedding FROM reports WHERE embedding IS NOT NULL AND timestamp > ?",
+                        (cutoff,)).fetchall()
+    if not rows:
+        return None
+    emb_matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+    scores = emb_matrix @ q_emb
+    best = int(scores.argmax())
+    if scores[best] < SIMILARITY_THRESHOLD:
+        return None
+    return decode_report(conn.execute("SELECT report FROM reports WHERE id = ?", (rows[best][0],)).fetchone()[0])
+
 st.title("Research AI Agent")
 
 # API keys input in sidebar
@@ -28,10 +206,8 @@ if not gemini_api_key or not tavily_api_key:
     st.warning("Please enter your Gemini and Tavily API keys in the sidebar to proceed.")
 else:
     try:
-        genai.configure(api_key=gemini_api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')  # Suitable for free tier
-        tavily = TavilyClient(api_key=tavily_api_key)
-        conn = init_db()
+        model, tavily = get_clients(gemini_api_key, tavily_api_key)
+        conn = get_conn()
         
         # Use tabs for Research and History
         tabs = st.tabs(["Research", "History"])
@@ -42,78 +218,56 @@ else:
                 if query:
                     with st.spinner("Researching..."):
                         try:
-                            # Step 1: Use Tavily to find 2-3 useful sources
-                            search_response = tavily.search(query=query, max_results=3)
-                            urls = [result['url'] for result in search_response['results']]
+                            # Reuse a stored report if a near-identical query was already answered
+                            q_emb = get_embedder().encode([query], normalize_embeddings=True)[0]
+                            cached_report = find_similar_report(conn, q_emb)
+                            if cached_report is not None:
+                                st.success("Found a saved report for a similar query.")
+                                st.markdown(cached_report)
+                            else:
+                                # Step 1: Use Tavily to find 2-3 useful sources
+                                search_results = tavily_search(tavily, ' '.join(query.lower().split()), 3)
+                                urls = [result['url'] for result in search_results]
                             
-                            extracts = []
-                            for url in urls:
-                                try:
-                                    if url.lower().endswith('.pdf'):
-                                        # Handle PDF
-                                        resp = requests.get(url, timeout=10)
-                                        resp.raise_for_status()
-                                        pdf = PdfReader(BytesIO(resp.content))
-                                        text = ''
-                                        for page in pdf.pages:
-                                            text += page.extract_text() + '\n'
-                                    else:
-                                        # Handle HTML
-                                        downloaded = trafilatura.fetch_url(url)
-                                        if downloaded:
-                                            text = trafilatura.extract(downloaded)
-                                            if not text:
-                                                # Fallback to readability-lxml
-                                                resp = requests.get(url, timeout=10)
-                                                resp.raise_for_status()
-                                                doc = Document(resp.text)
-                                                text = doc.summary()
-                                        else:
-                                            st.warning(f"Could not fetch content from {url}. Skipping.")
-                                            continue
-                                    
-                                    # Advanced strategy: Use LLM to extract only relevant info
-                                    if len(text) > 50000:  # Limit to avoid token overload
-                                        text = text[:50000]
-                                    extract_prompt = f"Extract only the most relevant information to the query '{query}' from this text. Be concise and include key points only, nothing extra or irrelevant:"
-                                    response = model.generate_content(extract_prompt + "\n\n" + text)
-                                    relevant_text = response.text
-                                    
-                                    extracts.append({'url': url, 'content': relevant_text})
-                                except requests.exceptions.RequestException as e:
-                                    st.warning(f"Error fetching {url} (possibly blocked): {str(e)}. Skipping.")
-                                except Exception as e:
-                                    st.warning(f"Unexpected error with {url}: {str(e)}. Skipping.")
+                                # Fetch all sources concurrently; warnings are shown after the join
+                                # because Streamlit calls aren't thread-safe. The only LLM call is the
+                                # final report, which needs every source, so there is nothing left to
+                                # pipeline behind the fetches and threads suffice (no asyncio loop needed).
+                                cached_texts = get_cached_texts(conn, urls)
+                                to_fetch = [url for url in urls if url not in cached_texts]
+                                fetched = {}
+                                if to_fetch:
+                                    session = get_session()
+                                    with ThreadPoolExecutor(max_workers=min(4, len(to_fetch))) as ex:
+                                        futures = [ex.submit(process_url, url, session, model) for url in to_fetch]
+                                        results = [f.result() for f in futures]
+                                    for extract, warning in results:
+                                        if warning:
+                                            st.warning(warning)
+                                        if extract:
+                                            fetched[extract['url']] = extract['text']
+                                    cache_texts(conn, fetched)
+                                extracts = [{'url': url, 'text': cached_texts[url] if url in cached_texts else fetched[url]}
+                                            for url in urls if url in cached_texts or url in fetched]
                             
-                            if not extracts:
-                                st.error("No valid sources could be extracted. Please try a different query.")
-                            else:
-                                # Step 2: Summarize the extracted content using LLM
-                                summaries = []
-                                for ext in extracts:
-                                    try:
-                                        summary_prompt = f"Summarize this relevant content for the query '{query}' in a few key points:"
-                                        response = model.generate_content(summary_prompt + "\n\n" + ext['content'])
-                                        summaries.append({'url': ext['url'], 'summary': response.text})
-                                    except Exception as e:
-                                        st.warning(f"Error summarizing {ext['url']}: {str(e)}")
+                                if not extracts:
+                                    st.error("No valid sources could be extracted. Please try a different query.")
+                                else:
+                                    # Step 2: One LLM call reads every source and writes the structured report
+                                    overall_prompt = f"For query '{query}', produce a short, structured bullet-point report using only the relevant information from these sources. Cite sources and include source links at the end. Sources:\n" + "".join(
+                                        f"\n\n---SOURCE {i} ({ext['url']})---\n{ext['text']}" for i, ext in enumerate(extracts, 1)
+                                    )
                                 
-                                # Step 3: Create overall structured report
-                                overall_prompt = f"Create a short, structured report for the query '{query}' based on these source summaries. Use bullet points for key findings and include source links at the end:"
-                                for sum in summaries:
-                                    overall_prompt += f"\n\nSource: {sum['url']}\nSummary: {sum['summary']}"
+                                    # Render tokens as they arrive; write_stream returns the full text for saving
+                                    stream = model.generate_content(overall_prompt, stream=True)
+                                    report = st.write_stream(chunk.text for chunk in stream)
                                 
-                                response = model.generate_content(overall_prompt)
-                                report = response.text
+                                    # Save to database
+                                    c = conn.cursor()
+                                    c.execute("INSERT INTO reports (query, report, timestamp, embedding) VALUES (?, ?, ?, ?)",
+                                              (query, encode_report(report), datetime.now().isoformat(), q_emb.astype(np.float32).tobytes()))
                                 
-                                # Save to database
-                                c = conn.cursor()
-                                c.execute("INSERT INTO reports (query, report, timestamp) VALUES (?, ?, ?)",
-                                          (query, report, datetime.now().isoformat()))
-                                conn.commit()
-                                
-                                st.success("Research complete! Report generated and saved.")
-                                st.markdown(report)
+                                    st.success("Research complete! Report generated and saved.")
                         except Exception as e:
                             st.error(f"An error occurred during research: {str(e)}")
                 else:
@@ -121,15 +275,18 @@ else:
         
         with tabs[1]:
             st.header("Search History")
+            # Fetch only metadata up front; a report body is loaded when the user asks for it
             c = conn.cursor()
-            c.execute("SELECT * FROM reports ORDER BY timestamp DESC")
+            c.execute("SELECT id, query, timestamp FROM reports ORDER BY timestamp DESC LIMIT 50")
             rows = c.fetchall()
             if not rows:
                 st.info("No history yet. Perform a research query to start.")
             for row in rows:
-                with st.expander(f"Query: {row[1]} (Timestamp: {row[3]})"):
-                    st.markdown(row[2])
-        
-        conn.close()
+                with st.expander(f"Query: {row[1]} (Timestamp: {row[2]})"):
+                    body_key = f"body_{row[0]}"
+                    if body_key not in st.session_state and st.button("Load report", key=f"load_{row[0]}"):
+                        st.session_state[body_key] = decode_report(conn.execute("SELECT report FROM reports WHERE id = ?", (row[0],)).fetchone()[0])
+                    if body_key in st.session_state:
+                        st.markdown(st.session_state[body_key])
     except Exception as e:
         st.error(f"Failed to initialize the agent: {str(e)}. Check your API keys and dependencies.")